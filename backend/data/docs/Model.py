@@ -1,10 +1,32 @@
 import pandas as pd
 import numpy as np
+import scipy.sparse as sp
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.svm import SVC
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.svm import LinearSVC
 from sklearn.metrics import confusion_matrix, accuracy_score
 import joblib
+from joblib import Parallel, delayed
+
+
+def predict_linear(X, W, b, classes, batch_size=512):
+    """Score a batch with one GEMM: X @ W.T + b, split across threads for large batches"""
+    X = X.astype(np.float32) if sp.issparse(X) else np.asarray(X, dtype=np.float32)
+
+    def score(rows):
+        scores = rows @ W.T + b
+        if scores.shape[1] == 1:
+            return classes[(scores[:, 0] > 0).astype(np.intp)]
+        return classes[scores.argmax(axis=1)]
+
+    n_rows = X.shape[0]
+    if n_rows <= batch_size:
+        return score(X)
+    parts = Parallel(n_jobs=-1, prefer="threads")(
+        delayed(score)(X[i:i + batch_size]) for i in range(0, n_rows, batch_size)
+    )
+    return np.concatenate(parts)
+
 
 print("Loading dataset...")
 
@@ -15,33 +37,43 @@ print(heart_disease_data.head(), "\n")
 
 # Separate target
 y = heart_disease_data['target']
+X = heart_disease_data.drop(['target'], axis=1)
 
-# One-hot encode ALL categorical columns like Kaggle
-X_encoded = pd.get_dummies(
-    heart_disease_data.drop(['target'], axis=1),
-    columns=['sex','cp','fbs','restecg','exang','slope','ca','thal']
-)
-
-print("\nAfter Encoding:")
-print(X_encoded.head(), "\n")
-print(f"Total Features After Encoding: {X_encoded.shape[1]}\n")
+categorical_cols = ['sex','cp','fbs','restecg','exang','slope','ca','thal']
+numeric_cols = [c for c in X.columns if c not in categorical_cols]
 
 # Train-test split (same as Kaggle)
-X_train, X_test, y_train, y_test = train_test_split(
-    X_encoded, y, test_size=0.2, random_state=1
+X_train_raw, X_test_raw, y_train, y_test = train_test_split(
+    X, y, test_size=0.2, random_state=1
 )
 
-# Scale data (same as Kaggle)
+# One-hot encode ALL categorical columns like Kaggle, kept sparse (CSR)
+encoder = OneHotEncoder(sparse_output=True, dtype=np.float32, handle_unknown='ignore')
+X_train_cat = encoder.fit_transform(X_train_raw[categorical_cols])
+X_test_cat = encoder.transform(X_test_raw[categorical_cols])
+
+# Scale the numeric columns only; one-hot columns stay 0/1
 scaler = StandardScaler()
-X_train = scaler.fit_transform(X_train)
-X_test = scaler.transform(X_test)
+X_train_num = scaler.fit_transform(X_train_raw[numeric_cols]).astype(np.float32, copy=False)
+X_test_num = scaler.transform(X_test_raw[numeric_cols]).astype(np.float32, copy=False)
+
+X_train = sp.hstack([X_train_num, X_train_cat], format='csr')
+X_test = sp.hstack([X_test_num, X_test_cat], format='csr')
 
-# Train SVM model (exact Kaggle config)
-svc = SVC(kernel='linear', random_state=0)
+print(f"\nTotal Features After Encoding: {X_train.shape[1]}\n")
+
+# Train linear SVM with liblinear's primal solver. This approximates SVC(kernel='linear'):
+# squared hinge loss and a regularized intercept give different coefficients, so
+# predictions and accuracy may differ from the kernel SVC
+svc = LinearSVC(C=1.0, loss="squared_hinge", dual=False, random_state=0)
 svc.fit(X_train, y_train)
 
+# Extract the linear decision function for GEMM-based scoring
+W = svc.coef_.astype(np.float32)
+b = svc.intercept_.astype(np.float32)
+
 # Predictions
-y_pred = svc.predict(X_test)
+y_pred = predict_linear(X_test, W, b, svc.classes_)
 
 # Results
 cm = confusion_matrix(y_test, y_pred)
@@ -53,8 +85,10 @@ print(cm)
 print(f"\nAccuracy: {acc}")
 
 # Save model + scaler
-joblib.dump(svc, "heart_model.pkl")
-joblib.dump(scaler, "scaler.pkl")
+joblib.dump(svc, "heart_model.pkl", compress=3)
+joblib.dump(scaler, "scaler.pkl", compress=3)
+joblib.dump(encoder, "encoder.pkl", compress=3)
+np.savez("heart_model_weights.npz", W=W, b=b, classes=svc.classes_)
 
 print("\nModel and Scaler saved successfully!")
-print("Files generated: heart_model.pkl, scaler.pkl")
+print("Files generated: heart_model.pkl, scaler.pkl, encoder.pkl, heart_model_weights.npz")
@@ -1,14 +1,29 @@
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, UploadFile, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from langchain.text_splitter import RecursiveCharacterTextSplitter
 from rag import RAGPipeline
 from model import SLMModel
+from transformers import TextIteratorStreamer
 import os
-import shutil
-from typing import Dict, List
+import re
+import time
+import uuid
+import asyncio
+import aiofiles
+import json
+import math
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,20 +32,191 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# /ask, /history and /sessions bodies are repetitive multi-KB JSON
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 rag = RAGPipeline()
 if not os.path.exists("./chroma_db"):
     rag.load_docs()
 
-slm = SLMModel()
+slm = SLMModel(compile_model=os.getenv("SLM_COMPILE") == "1")
+
+# Blocking SLM/RAG work runs here; keep it small so it matches GPU concurrency
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("SLM_WORKERS", "2")))
+# Upload parsing, embedding and persists get their own threads so indexing never starves /ask
+INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("INGEST_WORKERS", "2")))
+
+# Concurrent prompts are coalesced into one generate_batch call by batch_worker;
+# it is the only caller of the SLM, so GPU work and the model's caches stay serial
+MAX_BATCH = int(os.getenv("SLM_MAX_BATCH", "4"))
+BATCH_WINDOW = 0.02
+# How long /ask/stream waits on the streamer before re-checking its generation
+STREAM_POLL_SECONDS = 1.0
+PENDING: "asyncio.Queue[tuple[str, List[str], int, asyncio.Future, Optional[TextIteratorStreamer]]]" = asyncio.Queue()
+
+async def batch_worker():
+    loop = asyncio.get_running_loop()
+    # One prefill per phase before the first request, so no /ask pays for its
+    # phase's preamble and priming never overlaps a generation
+    try:
+        await loop.run_in_executor(EXECUTOR, prime_phase_prefixes)
+    except Exception as e:
+        print(f"Prefix warmup error: {str(e)}")
+    # A stream pulled while filling a batch waits for the next round
+    carry = None
+    while True:
+        batch = [carry or await PENDING.get()]
+        carry = None
+        deadline = loop.time() + BATCH_WINDOW
+        # Streams run on their own
+        while len(batch) < MAX_BATCH and batch[0][4] is None:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(PENDING.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item[4] is not None:
+                carry = item
+                break
+            batch.append(item)
+        
+        try:
+            if batch[0][4] is not None:
+                prefix, segments, max_tokens, _, streamer = batch[0]
+                outputs = [await loop.run_in_executor(
+                    EXECUTOR, slm.stream_with_prefix, prefix, segments, streamer, max_tokens
+                )]
+            elif len(batch) == 1 and batch[0][0]:
+                # A lone prompt can reuse the cached KV state of its prefix
+                prefix, segments, max_tokens, _, _ = batch[0]
+                outputs = [await loop.run_in_executor(
+                    EXECUTOR, slm.generate_with_prefix, prefix, segments, max_tokens
+                )]
+            else:
+                prompts = [[prefix, *segments] for prefix, segments, _, _, _ in batch]
+                max_tokens = [tokens for _, _, tokens, _, _ in batch]
+                outputs = await loop.run_in_executor(
+                    EXECUTOR, slm.generate_batch, prompts, max_tokens
+                )
+        except Exception as e:
+            for _, _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            continue
+        
+        for (_, _, _, fut, _), output in zip(batch, outputs):
+            if not fut.done():
+                fut.set_result(output)
+
+def enqueue(segments: List[str], max_tokens: int, prefix: str = "",
+            streamer: Optional[TextIteratorStreamer] = None) -> asyncio.Future:
+    fut = asyncio.get_running_loop().create_future()
+    PENDING.put_nowait((prefix, segments, max_tokens, fut, streamer))
+    return fut
+
+async def submit(segments: List[str], max_tokens: int, prefix: str = "") -> str:
+    # Prompts are passed as segments so SLMModel can reuse token ids of repeated pieces
+    return await enqueue(segments, max_tokens, prefix)
+
+# Uploads mark the vector store dirty; persist_worker flushes bursts with one persist()
+PERSIST_DELAY = 2.0
+PERSIST_DIRTY = asyncio.Event()
+
+async def persist_worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        await PERSIST_DIRTY.wait()
+        await asyncio.sleep(PERSIST_DELAY)
+        PERSIST_DIRTY.clear()
+        try:
+            await loop.run_in_executor(INGEST_EXECUTOR, rag.db.persist)
+        except Exception as e:
+            # Retry on the next cycle rather than letting the worker die
+            print(f"Persist error: {str(e)}")
+            PERSIST_DIRTY.set()
+
+def prime_phase_prefixes():
+    for prefix in DSS_PREFIXES.values():
+        slm.prime_prefix(prefix)
+
+@app.on_event("startup")
+async def start_background_workers():
+    app.state.batch_worker = asyncio.create_task(batch_worker())
+    app.state.persist_worker = asyncio.create_task(persist_worker())
+
+@app.on_event("shutdown")
+def persist_on_shutdown():
+    if PERSIST_DIRTY.is_set():
+        rag.db.persist()
 
 UPLOAD_DIR = "./data/docs/"
+UPLOAD_CHUNK_SIZE = 1 << 20
+SPLITTER = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=80)
+# Uploads whose raw bytes are not readable text; phase detection waits for the loader
+BINARY_UPLOADS = frozenset({'.pdf', '.pt', '.pth', '.pkl', '.pickle'})
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-conversations: Dict[str, List[Dict]] = {}
-session_files: Dict[str, List[str]] = {}
-session_timestamps: Dict[str, datetime] = {}
-session_phases: Dict[str, str] = {}
+@dataclass(slots=True)
+class SessionState:
+    last_activity: datetime = field(default_factory=datetime.now)
+    history: deque = field(default_factory=lambda: deque(maxlen=MAX_HISTORY))
+    files: List[str] = field(default_factory=list)
+    phase: Optional[str] = None
+    # Prompt pieces kept pre-formatted, updated when files or turns change
+    files_str: str = ""
+    history_tail: deque = field(default_factory=lambda: deque(maxlen=4))
+    # filename -> "indexing" | "indexed" | "failed" for background ingestion
+    indexing: Dict[str, str] = field(default_factory=dict)
+
+# Bounds on in-memory session state; only the last 4 turns feed the prompt
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+MAX_HISTORY = 20
+MAX_SESSION_FILES = 50
+# Idle sessions older than this are expired lazily as shards are touched
+SESSION_TTL = timedelta(hours=float(os.getenv("SESSION_TTL_HOURS", "24")))
+
+# Sessions are sharded by id, each shard with its own lock since sync endpoints
+# run on worker threads; shards are ordered from least to most recently active
+SESSION_SHARDS = 16
+SHARD_CAPACITY = max(1, MAX_SESSIONS // SESSION_SHARDS)
+_SHARDS = [(OrderedDict(), threading.RLock()) for _ in range(SESSION_SHARDS)]
+
+def _shard(session_id: str):
+    return _SHARDS[hash(session_id) % SESSION_SHARDS]
+
+def session_lock(session_id: str) -> threading.RLock:
+    return _shard(session_id)[1]
+
+def get_session(session_id: str) -> Optional[SessionState]:
+    session = _shard(session_id)[0].get(session_id)
+    if session is not None and session.last_activity < datetime.now() - SESSION_TTL:
+        return None
+    return session
+
+def drop_session(session_id: str):
+    shard, lock = _shard(session_id)
+    with lock:
+        shard.pop(session_id, None)
+
+def touch_session(session_id: str) -> SessionState:
+    shard, lock = _shard(session_id)
+    now = datetime.now()
+    cutoff = now - SESSION_TTL
+    with lock:
+        # Expired sessions sit at the head, including this one if it went idle
+        while shard and next(iter(shard.values())).last_activity < cutoff:
+            shard.popitem(last=False)
+        session = shard.get(session_id)
+        if session is None:
+            session = shard[session_id] = SessionState()
+        else:
+            shard.move_to_end(session_id)
+        session.last_activity = now
+        while len(shard) > SHARD_CAPACITY:
+            shard.popitem(last=False)
+        return session
 
 class ChatRequest(BaseModel):
     question: str
@@ -107,196 +293,445 @@ SDLC_PHASES = {
     }
 }
 
+# Phase keywords in priority order; each list is one compiled alternation
+_PHASE_KEYWORDS = [
+    ("requirements", ['requirement', 'srs', 'user story', 'use case', 'functional spec']),
+    ("design", ['design', 'architecture', 'uml', 'diagram', 'schema', 'erd']),
+    ("testing", ['test', 'pytest', 'unittest', 'spec.', 'test_', '_test']),
+    ("deployment", ['deploy', 'docker', 'kubernetes', 'ci/cd', 'pipeline', '.yml', '.yaml']),
+]
+# One scan for every phase: each keyword list is a named group, and the
+# lookahead lets overlapping keywords all be seen without consuming text
+_PHASE_RE = re.compile('(?=' + '|'.join(
+    f"(?P<{phase}>{'|'.join(map(re.escape, keywords))})"
+    for phase, keywords in _PHASE_KEYWORDS
+) + ')')
+_PHASE_PRIORITY = {phase: rank for rank, (phase, _) in enumerate(_PHASE_KEYWORDS)}
+
+# Phase signals live in titles and headers, so only the head of a document is scanned
+PHASE_SCAN_CHARS = 16384
+
 def detect_sdlc_phase(file_content: str, filename: str) -> str:
-    file_lower = filename.lower()
-    content_lower = file_content.lower()
-    
-    if any(keyword in file_lower or keyword in content_lower for keyword in 
-           ['requirement', 'srs', 'user story', 'use case', 'functional spec']):
-        return "requirements"
-    elif any(keyword in file_lower or keyword in content_lower for keyword in 
-             ['design', 'architecture', 'uml', 'diagram', 'schema', 'erd']):
-        return "design"
-    elif any(keyword in file_lower or keyword in content_lower for keyword in 
-             ['test', 'pytest', 'unittest', 'spec.', 'test_', '_test']):
-        return "testing"
-    elif any(keyword in file_lower or keyword in content_lower for keyword in 
-             ['deploy', 'docker', 'kubernetes', 'ci/cd', 'pipeline', '.yml', '.yaml']):
-        return "deployment"
-    elif any(ext in file_lower for ext in ['.py', '.js', '.java', '.cpp', '.c', '.go', '.rs']):
-        return "development"
+    text = filename.lower() + "\n" + file_content[:PHASE_SCAN_CHARS].lower()
+    
+    # Earlier phases in _PHASE_KEYWORDS win, wherever they appear
+    best = None
+    for match in _PHASE_RE.finditer(text):
+        phase = match.lastgroup
+        if best is None or _PHASE_PRIORITY[phase] < _PHASE_PRIORITY[best]:
+            best = phase
+            if _PHASE_PRIORITY[phase] == 0:
+                break
+    if best is not None:
+        return best
     
+    # Source files and anything unmatched fall back to development
     return "development"
 
-def format_sdlc_response(raw_response: str, phase_name: str) -> str:
-    import re
+def build_dss_prefix(phase_info: Dict) -> str:
+    criteria_bulleted = "\n".join(f"   - {criterion}" for criterion in phase_info['verification_criteria'])
+    return f"""You are an expert SDLC Decision Support System.
+
+Phase: {phase_info['name']}
+Description: {phase_info['description']}
+
+Task:
+1. Analyze the provided documents for the {phase_info['name']} phase
+2. Verify against these criteria:
+{criteria_bulleted}
+3. Identify specific issues and gaps
+4. Provide clear, actionable recommendations
+5. Determine risk level: Low, Medium, or High
+6. List what additional information is needed (if any)
+
+Output format (use these exact section headers):
+
+ANALYSIS:
+[2-3 sentences on current state and quality]
+
+PHASE COMPLIANCE:
+[For each criterion: MET/PARTIAL/NOT MET with brief reason]
+
+ISSUES FOUND:
+[List 3-5 specific issues or state "No critical issues found"]
+
+RECOMMENDATIONS:
+[List 4-6 actionable recommendations, prioritized]
+
+RISK LEVEL:
+[Low/Medium/High Risk with 2 sentence justification]
+
+NEXT STEPS:
+[List 4-6 prioritized action items]
+
+MISSING INFORMATION:
+[What additional artifacts/data are needed, or state "None"]
+
+Be concise, specific, and actionable. Use numbered lists."""
+
+def build_verify_header(phase_info: Dict) -> str:
+    return f"""You are an SDLC Compliance Auditor.
+
+Phase: {phase_info['name']}
+Criteria: {', '.join(phase_info['verification_criteria'])}
+
+Question:"""
+
+# Phase text is static, so the prompt heads are rendered once per phase
+DSS_PREFIXES = {phase: build_dss_prefix(info) for phase, info in SDLC_PHASES.items()}
+VERIFY_HEADERS = {phase: build_verify_header(info) for phase, info in SDLC_PHASES.items()}
+
+# Bold, italic, inline code and header markers stripped in a single pass
+_RE_MARKDOWN = re.compile(r'\*\*(.*?)\*\*|\*(.*?)\*|`(.*?)`|#+\s*')
+_DIGITS = '0123456789'
+
+def unwrap_markdown(match) -> str:
+    if match.lastindex is None:
+        return ''
+    inner = match.group(match.lastindex)
+    # Spans can nest (e.g. italic inside bold), so strip the inner text too
+    return _RE_MARKDOWN.sub(unwrap_markdown, inner) if inner else inner
+
+_SECTION_KEYWORDS = [
+    ('analysis', ['ANALYSIS']),
+    ('phase_compliance', ['PHASE COMPLIANCE', 'COMPLIANCE']),
+    ('issues', ['ISSUES FOUND', 'ISSUES']),
+    ('recommendations', ['RECOMMENDATIONS']),
+    ('risk', ['RISK LEVEL', 'RISK']),
+    ('next_steps', ['NEXT STEPS']),
+    ('missing', ['MISSING INFORMATION', 'MISSING'])
+]
+# Any-keyword screen so content lines are rejected in one scan
+_RE_SECTION = re.compile('|'.join(
+    re.escape(keyword) for _, keywords in _SECTION_KEYWORDS for keyword in keywords
+))
+_SECTION_TITLES = {
+    'analysis': '📋 ANALYSIS',
+    'phase_compliance': '✓ PHASE COMPLIANCE',
+    'issues': '⚠ ISSUES FOUND',
+    'recommendations': '💡 RECOMMENDATIONS',
+    'risk': '🎯 RISK LEVEL',
+    'next_steps': '→ NEXT STEPS',
+    'missing': '❓ MISSING INFORMATION'
+}
+_NUMBERED_SECTIONS = frozenset({'issues', 'recommendations', 'next_steps', 'missing', 'phase_compliance'})
+_RULE = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+
+def is_section_header(line: str):
+    line_upper = line.upper()
+    if not _RE_SECTION.search(line_upper):
+        return None
+    # Keep section priority when a line mentions more than one keyword
+    for section_type, keywords in _SECTION_KEYWORDS:
+        if any(keyword in line_upper for keyword in keywords):
+            return section_type
+    return None
+
+def strip_list_marker(line: str) -> str:
+    # Lines arrive stripped and non-empty: drop a leading "12." and then a bullet
+    if line[0] in _DIGITS:
+        rest = line.lstrip(_DIGITS)
+        if rest[:1] == '.':
+            line = rest[1:].lstrip()
+    if line[:1] in ('*', '-', '•'):
+        line = line[1:].lstrip()
+    return line
+
+def format_section(section_name: str, content_lines: List[str], result: List[str]):
+    result.append(f"\n{_SECTION_TITLES.get(section_name, section_name.upper())}\n")
+    result.append("─" * 50 + "\n")
+    numbered = section_name in _NUMBERED_SECTIONS
     
-    text = re.sub(r'\*\*(.*?)\*\*', r'\1', raw_response)
-    text = re.sub(r'\*(.*?)\*', r'\1', text)
-    text = re.sub(r'`(.*?)`', r'\1', text)
-    text = re.sub(r'#+\s*', '', text)
+    item_counter = 1
+    for line in content_lines:
+        line = strip_list_marker(line)
+        
+        if numbered:
+            result.append(f"{item_counter}. {line}\n")
+            item_counter += 1
+        else:
+            result.append(f"{line}\n")
     
-    lines = [line.strip() for line in text.split('\n') if line.strip()]
+    result.append("\n")
+
+def format_sdlc_response(raw_response: str, phase_name: str) -> str:
+    text = raw_response
+    # Plain outputs skip the regex engine entirely
+    if '*' in text or '`' in text or '#' in text:
+        text = _RE_MARKDOWN.sub(unwrap_markdown, text)
     
-    output = f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-    output += f"SDLC EVALUATION: {phase_name.upper()}\n"
-    output += f"━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+    output = [_RULE, f"SDLC EVALUATION: {phase_name.upper()}\n", _RULE, "\n"]
     
     current_section = None
     section_content = []
     
-    section_keywords = {
-        'analysis': ['ANALYSIS'],
-        'phase_compliance': ['PHASE COMPLIANCE', 'COMPLIANCE'],
-        'issues': ['ISSUES FOUND', 'ISSUES'],
-        'recommendations': ['RECOMMENDATIONS'],
-        'risk': ['RISK LEVEL', 'RISK'],
-        'next_steps': ['NEXT STEPS'],
-        'missing': ['MISSING INFORMATION', 'MISSING']
-    }
-    
-    def is_section_header(line):
-        line_upper = line.upper()
-        for section_type, keywords in section_keywords.items():
-            if any(keyword in line_upper for keyword in keywords):
-                return section_type
-        return None
-    
-    def format_section(section_name, content_lines):
-        if not content_lines:
-            return ""
-        
-        section_titles = {
-            'analysis': '📋 ANALYSIS',
-            'phase_compliance': '✓ PHASE COMPLIANCE',
-            'issues': '⚠ ISSUES FOUND',
-            'recommendations': '💡 RECOMMENDATIONS',
-            'risk': '🎯 RISK LEVEL',
-            'next_steps': '→ NEXT STEPS',
-            'missing': '❓ MISSING INFORMATION'
-        }
-        
-        result = f"\n{section_titles.get(section_name, section_name.upper())}\n"
-        result += "─" * 50 + "\n"
-        
-        item_counter = 1
-        for line in content_lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            line = re.sub(r'^\d+\.\s*', '', line)
-            line = re.sub(r'^[\*\-•]\s*', '', line)
-            
-            if section_name in ['issues', 'recommendations', 'next_steps', 'missing', 'phase_compliance']:
-                result += f"{item_counter}. {line}\n"
-                item_counter += 1
-            else:
-                result += f"{line}\n"
-        
-        return result + "\n"
-    
-    for line in lines:
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            continue
         section_type = is_section_header(line)
         
         if section_type:
             if current_section and section_content:
-                output += format_section(current_section, section_content)
+                format_section(current_section, section_content, output)
             current_section = section_type
             section_content = []
         else:
             if current_section:
                 section_content.append(line)
             else:
-                output += line + "\n"
+                output.append(line + "\n")
     
     if current_section and section_content:
-        output += format_section(current_section, section_content)
+        format_section(current_section, section_content, output)
     
-    output += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+    output.append(_RULE)
     
-    return output
+    return "".join(output)
+
+_JSON_DECODER = json.JSONDecoder()
+# Verifier answers are started inside the JSON object so the model continues it
+VERIFY_JSON_PREFIX = '{\n  "pass_fail": "'
+
+def parse_verification(verification_output: str) -> Dict:
+    # Decode the first balanced object and ignore any trailing chatter
+    start = max(verification_output.find("{"), 0)
+    try:
+        return _JSON_DECODER.raw_decode(verification_output, start)[0]
+    except json.JSONDecodeError:
+        return {
+            "pass_fail": "UNKNOWN",
+            "compliance_score": 0.5,
+            "criteria_met": [],
+            "criteria_failed": [],
+            "risk_level": "Medium",
+            "recommendations": ["Manual review required"],
+            "explanation": "Could not parse verification"
+        }
+
+# Cheap rule-based verification read straight off the DSS output; the SLM
+# verifier only runs when these rules cannot decide
+QUICK_VERIFY_MAX_CHARS = 4000
+# Leaked secrets fail outright; hits that might just be prose or numbers defer to the SLM
+_PRIVATE_KEY_RE = re.compile(r'-----BEGIN [A-Z ]*PRIVATE KEY-----')
+_CARD_RE = re.compile(r'\b\d(?:[ -]?\d){12,18}\b')
+_SSN_RE = re.compile(r'\b\d{3}-\d{2}-\d{4}\b')
+_SECRET_ASSIGN_RE = re.compile(
+    r'(?i)\b(?:password|passwd|api[ _-]?key|secret[ _-]?key|access[ _-]?token)\b\s*[:=]\s*'
+    r'("[^"\s]+"|\'[^\'\s]+\'|\S+)'
+)
+# Issuer prefixes of the major card networks (Visa, Mastercard, Amex, Discover)
+_CARD_PREFIXES = ('4', '51', '52', '53', '54', '55', '22', '23', '24', '25', '26', '27',
+                  '34', '37', '6011', '65')
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit) * (2 if i % 2 else 1)
+        total += value - 9 if value > 9 else value
+    return total % 10 == 0
+
+def secret_shaped(value: str) -> bool:
+    # Quoted literals, or long unquoted tokens mixing letters and digits with high entropy
+    if value[0] in '"\'':
+        return len(value) >= 8
+    value = value.rstrip('.,;)')
+    if len(value) < 16 or not any(c.isdigit() for c in value) or not any(c.isalpha() for c in value):
+        return False
+    entropy = -sum(
+        (n / len(value)) * math.log2(n / len(value))
+        for n in (value.count(c) for c in set(value))
+    )
+    return entropy >= 3.0
+
+def scan_sensitive(text: str) -> Optional[str]:
+    # "leak" for certain secrets, "ambiguous" for hits the rules can't judge, else None
+    if _PRIVATE_KEY_RE.search(text):
+        return "leak"
+    for match in _CARD_RE.finditer(text):
+        digits = match.group().replace(' ', '').replace('-', '')
+        if digits.startswith(_CARD_PREFIXES) and luhn_valid(digits):
+            return "leak"
+    ambiguous = False
+    for match in _SECRET_ASSIGN_RE.finditer(text):
+        if secret_shaped(match.group(1)):
+            return "leak"
+        ambiguous = True
+    if ambiguous or _SSN_RE.search(text):
+        return "ambiguous"
+    return None
+_VERIFY_SECTION_RE = re.compile(
+    r'^[#*\s]*(ANALYSIS|PHASE COMPLIANCE|ISSUES FOUND|RECOMMENDATIONS|RISK LEVEL|NEXT STEPS|'
+    r'MISSING INFORMATION)\b[*\s]*(?::[*\s]*(.*))?$'
+)
+# Longest phrasings first so a qualified "met" is never read as a bare MET
+_CRITERION_STATUS_RE = re.compile(r'\b(NOT FULLY MET|NOT YET MET|PARTIALLY MET|NOT MET|UNMET|PARTIAL|MET)\b')
+_CRITERION_STATUSES = {
+    'NOT FULLY MET': 'PARTIAL', 'PARTIALLY MET': 'PARTIAL', 'PARTIAL': 'PARTIAL',
+    'NOT YET MET': 'NOT MET', 'NOT MET': 'NOT MET', 'UNMET': 'NOT MET',
+    'MET': 'MET',
+}
+# Words that change what a bare MET means ("not completely met", "fully met")
+_MET_QUALIFIER_RE = re.compile(r'\b(?:NOT|PARTIAL\w*|FULLY|YET)\W+(?:\w+\W+)?$')
+_CRITERION_NUMBER_RE = re.compile(r'^(\d+)[.)]')
+_RISK_RE = re.compile(r'\b(LOW|MEDIUM|HIGH)\b')
+
+def verification_sections(text: str) -> Dict[str, List[str]]:
+    # Upper-cased content lines per DSS section; echoed "[...]" template lines are dropped
+    sections = {}
+    current = None
+    for line in text.upper().split('\n'):
+        line = line.strip()
+        match = _VERIFY_SECTION_RE.match(line)
+        if match:
+            current = sections.setdefault(match.group(1), [])
+            line = (match.group(2) or '').strip()
+        if current is None or not line or line.startswith('['):
+            continue
+        current.append(line)
+    return sections
+
+def criterion_statuses(lines: List[str], criteria: List[str]):
+    # One status per line, tied to its criterion by name or by its list number
+    names = [criterion.upper() for criterion in criteria]
+    statuses = {}
+    for line in lines:
+        found = set()
+        for match in _CRITERION_STATUS_RE.finditer(line):
+            if match.group(1) == 'MET' and _MET_QUALIFIER_RE.search(line, 0, match.start()):
+                return None
+            found.add(_CRITERION_STATUSES[match.group(1)])
+        if not found:
+            continue
+        if len(found) > 1:
+            return None
+        matches = [i for i, name in enumerate(names) if name in line]
+        number = _CRITERION_NUMBER_RE.match(line)
+        if len(matches) == 1:
+            index = matches[0]
+        elif number and 1 <= int(number.group(1)) <= len(criteria):
+            index = int(number.group(1)) - 1
+        else:
+            return None
+        if index in statuses:
+            return None
+        statuses[index] = found.pop()
+    if len(statuses) != len(criteria):
+        return None
+    return [statuses[i] for i in range(len(criteria))]
+
+def quick_verification(dss_output: str, phase_info: Dict):
+    sensitive = scan_sensitive(dss_output)
+    if sensitive == "leak":
+        return {
+            "pass_fail": "FAIL",
+            "compliance_score": 0.0,
+            "criteria_met": [],
+            "criteria_failed": list(phase_info['verification_criteria']),
+            "risk_level": "High",
+            "recommendations": ["Remove secrets and personal data from the response"],
+            "explanation": "Response contains sensitive data"
+        }
+    if sensitive or len(dss_output) > QUICK_VERIFY_MAX_CHARS:
+        return None
+    
+    sections = verification_sections(dss_output)
+    criteria = phase_info['verification_criteria']
+    statuses = criterion_statuses(sections.get("PHASE COMPLIANCE", []), criteria)
+    if statuses is None:
+        return None
+    
+    criteria_met = [c for c, status in zip(criteria, statuses) if status == "MET"]
+    criteria_failed = [c for c, status in zip(criteria, statuses) if status == "NOT MET"]
+    partial = [c for c, status in zip(criteria, statuses) if status == "PARTIAL"]
+    score = round((len(criteria_met) + 0.5 * len(partial)) / len(criteria), 2)
+    
+    risk_match = _RISK_RE.search("\n".join(sections.get("RISK LEVEL", [])))
+    if risk_match:
+        risk_level = risk_match.group(1).capitalize()
+    else:
+        risk_level = "High" if criteria_failed else ("Medium" if partial else "Low")
+    
+    return {
+        "pass_fail": "FAIL" if criteria_failed else "PASS",
+        "compliance_score": score,
+        "criteria_met": criteria_met,
+        "criteria_failed": criteria_failed,
+        "risk_level": risk_level,
+        "recommendations": [f"Complete: {c}" for c in criteria_failed + partial],
+        "explanation": "Derived from the phase compliance section of the analysis"
+    }
+
+async def ingest_chunks(chunks, filename: str, session: SessionState):
+    try:
+        await asyncio.get_running_loop().run_in_executor(INGEST_EXECUTOR, rag.add_documents, chunks)
+        PERSIST_DIRTY.set()
+        session.indexing[filename] = "indexed"
+        print(f"Indexed {filename} ({len(chunks)} chunks)")
+    except Exception as e:
+        session.indexing[filename] = "failed"
+        print(f"Indexing error for {filename}: {str(e)}")
 
 @app.post("/upload")
-async def upload_file(file: UploadFile = File(...), session_id: str = "default"):
+async def upload_file(background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                      session_id: str = "default"):
     try:
+        loop = asyncio.get_running_loop()
         file_path = os.path.join(UPLOAD_DIR, file.filename)
         
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        if session_id not in session_files:
-            session_files[session_id] = []
-        session_files[session_id].append(file.filename)
-        
-        session_timestamps[session_id] = datetime.now()
+        head = b""
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                if not head:
+                    head = chunk[:PHASE_SCAN_CHARS]
+                await buffer.write(chunk)
         
-        from langchain.text_splitter import RecursiveCharacterTextSplitter
+        session = touch_session(session_id)
+        with session_lock(session_id):
+            session.files.append(file.filename)
+            del session.files[:-MAX_SESSION_FILES]
+            session.files_str = ", ".join(session.files)
         
         ext = os.path.splitext(file.filename)[1].lower()
         
-        docs = []
-        if ext == '.txt':
-            from langchain_community.document_loaders import TextLoader
-            docs = TextLoader(file_path).load()
-        elif ext == '.pdf':
-            from langchain_community.document_loaders import PDFPlumberLoader
-            docs = PDFPlumberLoader(file_path).load()
-        elif ext == '.py':
-            docs = rag.load_python_file(file_path)
-        elif ext == '.ipynb':
-            docs = rag.load_ipynb_file(file_path)
-        elif ext == '.json':
-            docs = rag.load_json_file(file_path)
-        elif ext == '.csv':
-            docs = rag.load_csv_file(file_path)
-        elif ext in ['.md']:
-            docs = rag.load_markdown_file(file_path)
-        elif ext in ['.yaml', '.yml']:
-            docs = rag.load_yaml_file(file_path)
-        elif ext in ['.pt', '.pth']:
-            docs = rag.load_pytorch_model_info(file_path)
-        elif ext in ['.pkl', '.pickle']:
-            docs = rag.load_pickle_file(file_path)
-        elif ext in ['.js', '.jsx', '.ts', '.tsx', '.java', '.cpp', '.c', '.h', 
-                     '.rs', '.go', '.rb', '.php', '.html', '.css', '.xml', '.sh', '.r', '.sql']:
-            lang_map = {
-                '.js': 'javascript', '.jsx': 'javascript', '.ts': 'typescript', 
-                '.tsx': 'typescript', '.java': 'java', '.cpp': 'cpp', '.c': 'c',
-                '.h': 'c', '.rs': 'rust', '.go': 'go', '.rb': 'ruby', '.php': 'php',
-                '.html': 'html', '.css': 'css', '.xml': 'xml', '.sh': 'shell',
-                '.r': 'r', '.sql': 'sql'
-            }
-            docs = rag.load_code_file(file_path, lang_map.get(ext, 'code'))
-        else:
+        loader = rag.loaders.get(ext)
+        if loader is None:
             return {
                 "success": False,
                 "message": f"Unsupported file type: {ext}",
                 "filename": file.filename
             }
+        # Text uploads are classified from the bytes already in memory
+        if ext not in BINARY_UPLOADS:
+            detected_phase = detect_sdlc_phase(head.decode("utf-8", "ignore"), file.filename)
         
-        file_content = docs[0].page_content if docs else ""
-        detected_phase = detect_sdlc_phase(file_content, file.filename)
-        session_phases[session_id] = detected_phase
+        docs = await loop.run_in_executor(INGEST_EXECUTOR, loader, file_path)
         
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=80
-        )
-        chunks = splitter.split_documents(docs)
-        rag.db.add_documents(chunks)
-        rag.db.persist()
+        if ext in BINARY_UPLOADS:
+            file_content = docs[0].page_content if docs else ""
+            detected_phase = detect_sdlc_phase(file_content, file.filename)
+        session.phase = detected_phase
+        
+        chunks = await loop.run_in_executor(INGEST_EXECUTOR, SPLITTER.split_documents, docs)
+        # Embedding dominates upload time; respond now and index after the response is sent
+        with session_lock(session_id):
+            session.indexing.pop(file.filename, None)
+            session.indexing[file.filename] = "indexing"
+            while len(session.indexing) > MAX_SESSION_FILES:
+                del session.indexing[next(iter(session.indexing))]
+        background_tasks.add_task(ingest_chunks, chunks, file.filename, session)
         
         print(f"File uploaded: {file.filename} ({len(chunks)} chunks)")
         print(f"Detected SDLC Phase: {detected_phase}")
         
         return {
             "success": True,
-            "message": "File uploaded and processed successfully",
+            "message": "File uploaded; indexing in background",
+            "status": "ingesting",
             "filename": file.filename,
             "chunks_created": len(chunks),
             "session_id": session_id,
-            "session_files": session_files[session_id],
+            "session_files": session.files,
             "detected_sdlc_phase": detected_phase,
             "phase_info": SDLC_PHASES.get(detected_phase, {})
         }
@@ -309,132 +744,85 @@ async def upload_file(file: UploadFile = File(...), session_id: str = "default")
             "filename": file.filename
         }
 
-@app.post("/ask")
-def ask(request: ChatRequest):
-    import time
-    import json
-    import re
-    
-    start_time = time.time()
-    session_id = request.session_id
-    question = request.question
-    
-    if session_id not in conversations:
-        conversations[session_id] = []
-    
-    session_timestamps[session_id] = datetime.now()
-    
-    session_specific_files = session_files.get(session_id, [])
-    
+@app.get("/upload/status/{session_id}")
+def upload_status(session_id: str):
+    session = get_session(session_id)
+    return {
+        "session_id": session_id,
+        "files": dict(session.indexing) if session is not None else {}
+    }
+
+def resolve_phase(request: ChatRequest, session: SessionState) -> str:
     if request.sdlc_phase != "auto":
-        current_phase = request.sdlc_phase
-    else:
-        current_phase = session_phases.get(session_id, "development")
-    
-    phase_info = SDLC_PHASES.get(current_phase, SDLC_PHASES["development"])
+        return request.sdlc_phase
+    return session.phase or "development"
+
+async def build_dss_prompt(question: str, session: SessionState, current_phase: str):
+    loop = asyncio.get_running_loop()
     
     # Get RAG context
-    if session_specific_files:
-        context = rag.query(question, k=4, source_files=session_specific_files)
+    if session.files:
+        context = await loop.run_in_executor(
+            EXECUTOR, rag.query, question, 4, session.files
+        )
     else:
-        context = rag.query(question, k=4)
+        context = await loop.run_in_executor(EXECUTOR, rag.query, question, 4)
     
     # Limit context to essential information only
     context_summary = context[:800] if context else "No relevant documents found."
     
-    # Build conversation history (last 4 exchanges only)
+    # Conversation history (last 4 messages only)
     conversation_context = ""
-    if conversations[session_id]:
-        conversation_context = "\nRecent conversation:\n"
-        for msg in conversations[session_id][-4:]:
-            conversation_context += f"{msg['role']}: {msg['content'][:100]}...\n"
+    if session.history_tail:
+        conversation_context = "\nRecent conversation:\n" + "".join(session.history_tail)
     
     files_context = ""
-    if session_specific_files:
-        files_context = f"Uploaded files: {', '.join(session_specific_files)}"
+    if session.files_str:
+        files_context = f"Uploaded files: {session.files_str}"
     
-    # Optimized concise prompt
-    dss_prompt = f"""You are an expert SDLC Decision Support System.
+    # Phase-only prefix first so its KV cache can be reused across requests
+    dss_prefix = DSS_PREFIXES.get(current_phase, DSS_PREFIXES["development"])
+    
+    # Segments are tokenized separately, so each cut puts the separating whitespace at the
+    # start of the next segment, where the tokenizer would attach it anyway
+    dss_segments = [
+        f"""
 
-Phase: {phase_info['name']}
-Description: {phase_info['description']}
 Context: {files_context}
 Relevant documents: {context_summary}
 {conversation_context}
 
-User question: {question}
-
-Task:
-1. Analyze the provided documents for the {phase_info['name']} phase
-2. Verify against these criteria:
-{chr(10).join(f"   - {criterion}" for criterion in phase_info['verification_criteria'])}
-3. Identify specific issues and gaps
-4. Provide clear, actionable recommendations
-5. Determine risk level: Low, Medium, or High
-6. List what additional information is needed (if any)
-
-Output format (use these exact section headers):
-
-ANALYSIS:
-[2-3 sentences on current state and quality]
+User question:""",
+        f" {question}",
+        """
 
-PHASE COMPLIANCE:
-[For each criterion: MET/PARTIAL/NOT MET with brief reason]
-
-ISSUES FOUND:
-[List 3-5 specific issues or state "No critical issues found"]
-
-RECOMMENDATIONS:
-[List 4-6 actionable recommendations, prioritized]
-
-RISK LEVEL:
-[Low/Medium/High Risk with 2 sentence justification]
-
-NEXT STEPS:
-[List 4-6 prioritized action items]
-
-MISSING INFORMATION:
-[What additional artifacts/data are needed, or state "None"]
+Response:""",
+    ]
+    return dss_prefix, dss_segments
 
-Be concise, specific, and actionable. Use numbered lists.
-
-Response:"""
-    
-    print(f"Generating SDLC analysis...")
-    gen_start = time.time()
-    
-    dss_output = slm.generate(dss_prompt, max_tokens=700)
-    
-    if "Response:" in dss_output:
-        dss_output = dss_output.split("Response:")[-1].strip()
-    
-    formatted_output = format_sdlc_response(dss_output, phase_info['name'])
-    
-    print(f"Response generated in {time.time() - gen_start:.2f}s")
-    
-    conversations[session_id].append({
-        "role": "user",
-        "content": question
-    })
-    conversations[session_id].append({
-        "role": "assistant",
-        "content": formatted_output
-    })
+async def complete_ask(request: ChatRequest, session: SessionState, current_phase: str,
+                       dss_output: str) -> Dict:
+    question = request.question
+    phase_info = SDLC_PHASES.get(current_phase, SDLC_PHASES["development"])
     
     # Verification (if enabled)
     verification_result = None
+    verification_task = None
     if request.verify:
-        print(f"Running compliance verification...")
-        verification_prompt = f"""You are an SDLC Compliance Auditor.
-
-Phase: {phase_info['name']}
-Criteria: {', '.join(phase_info['verification_criteria'])}
-
-Question: {question}
-Response: {dss_output[:500]}
+        verification_result = quick_verification(dss_output, phase_info)
+        if verification_result is None:
+            print(f"Running compliance verification...")
+            # The question segment reuses the token ids from the DSS prompt
+            verification_segments = [
+                VERIFY_HEADERS.get(current_phase, VERIFY_HEADERS["development"]),
+                f" {question}",
+                """
+Response:""",
+                f" {dss_output[:500]}",
+                """
 
 Return ONLY valid JSON:
-{{
+{
   "pass_fail": "PASS or FAIL",
   "compliance_score": 0.85,
   "criteria_met": ["criterion 1", "criterion 2"],
@@ -442,52 +830,123 @@ Return ONLY valid JSON:
   "risk_level": "Low/Medium/High",
   "recommendations": ["rec 1", "rec 2"],
   "explanation": "brief explanation"
-}}"""
-        
-        ver_start = time.time()
-        verification_output = slm.generate(verification_prompt, max_tokens=250)
-        print(f"Verification completed in {time.time() - ver_start:.2f}s")
-        
-        try:
-            json_match = re.search(r'\{[\s\S]*\}', verification_output)
-            if json_match:
-                parsed_verification = json.loads(json_match.group(0))
-            else:
-                parsed_verification = json.loads(verification_output)
-        except:
-            parsed_verification = {
-                "pass_fail": "UNKNOWN",
-                "compliance_score": 0.5,
-                "criteria_met": [],
-                "criteria_failed": [],
-                "risk_level": "Medium",
-                "recommendations": ["Manual review required"],
-                "explanation": "Could not parse verification"
-            }
-        
-        verification_result = parsed_verification
+}""",
+                "\n\n" + VERIFY_JSON_PREFIX,
+            ]
+            
+            ver_start = time.time()
+            # Runs while the main answer is formatted and recorded below
+            verification_task = asyncio.create_task(submit(verification_segments, 250))
     
-    print(f"Total request: {time.time() - start_time:.2f}s")
+    formatted_output = format_sdlc_response(dss_output, phase_info['name'])
+    
+    with session_lock(request.session_id):
+        session.history.append({
+            "role": "user",
+            "content": question
+        })
+        session.history.append({
+            "role": "assistant",
+            "content": formatted_output
+        })
+        session.history_tail.append(f"user: {question[:100]}...\n")
+        session.history_tail.append(f"assistant: {formatted_output[:100]}...\n")
+    
+    if verification_task is not None:
+        verification_output = await verification_task
+        print(f"Verification completed in {time.time() - ver_start:.2f}s")
+        verification_result = parse_verification(VERIFY_JSON_PREFIX + verification_output)
     
     return {
         "query": question,
         "dss_output": formatted_output,
         "verification": verification_result,
-        "conversation_length": len(conversations[session_id]),
-        "session_files": session_specific_files,
+        "conversation_length": len(session.history),
+        "session_files": session.files,
         "sdlc_phase": current_phase,
         "phase_info": phase_info
     }
 
+@app.post("/ask")
+async def ask(request: ChatRequest):
+    start_time = time.time()
+    
+    session = touch_session(request.session_id)
+    current_phase = resolve_phase(request, session)
+    dss_prefix, dss_segments = await build_dss_prompt(request.question, session, current_phase)
+    
+    print(f"Generating SDLC analysis...")
+    gen_start = time.time()
+    
+    dss_output = (await submit(dss_segments, 700, prefix=dss_prefix)).strip()
+    
+    print(f"Response generated in {time.time() - gen_start:.2f}s")
+    
+    result = await complete_ask(request, session, current_phase, dss_output)
+    
+    print(f"Total request: {time.time() - start_time:.2f}s")
+    
+    return result
+
+@app.post("/ask/stream")
+async def ask_stream(request: ChatRequest):
+    loop = asyncio.get_running_loop()
+    
+    session = touch_session(request.session_id)
+    current_phase = resolve_phase(request, session)
+    dss_prefix, dss_segments = await build_dss_prompt(request.question, session, current_phase)
+    
+    # Streams queue behind in-flight generations; the prefix KV cache is still reused
+    streamer = slm.make_streamer(timeout=STREAM_POLL_SECONDS)
+    generation = enqueue(dss_segments, 700, dss_prefix, streamer)
+    
+    async def events():
+        parts = []
+        while True:
+            # The streamer blocks between tokens, so wait on it off the event loop
+            try:
+                text = await loop.run_in_executor(None, next, streamer, None)
+            except queue.Empty:
+                # Still queued or between tokens, unless generation already failed
+                if generation.done():
+                    break
+                continue
+            if text is None:
+                break
+            if text:
+                parts.append(text)
+                yield f"data: {json.dumps({'token': text})}\n\n"
+        
+        try:
+            await generation
+        except Exception as e:
+            print(f"Stream error: {str(e)}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+            return
+        
+        result = await complete_ask(request, session, current_phase, "".join(parts).strip())
+        yield f"event: done\ndata: {json.dumps(result)}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/ask")
-def ask_get(q: str, session_id: str = "default", verify: bool = False, sdlc_phase: str = "auto"):
+async def ask_get(q: str, session_id: str = "default", verify: bool = False, sdlc_phase: str = "auto"):
     request = ChatRequest(
         question=q,
         session_id=session_id,
         verify=verify,
         sdlc_phase=sdlc_phase
     )
-    return ask(request)
+    return await ask(request)
+
+@app.post("/flush")
+async def flush():
+    PERSIST_DIRTY.clear()
+    await asyncio.get_running_loop().run_in_executor(INGEST_EXECUTOR, rag.db.persist)
+    return {
+        "success": True,
+        "message": "Vector store persisted"
+    }
 
 @app.post("/set_phase/{session_id}")
 def set_phase(session_id: str, phase: str):
@@ -497,7 +956,7 @@ def set_phase(session_id: str, phase: str):
             "message": f"Invalid phase. Valid: {list(SDLC_PHASES.keys())}"
         }
     
-    session_phases[session_id] = phase
+    touch_session(session_id).phase = phase
     return {
         "success": True,
         "session_id": session_id,
@@ -514,24 +973,26 @@ def list_phases():
 
 @app.get("/history/{session_id}")
 def get_history(session_id: str):
+    session = get_session(session_id)
+    if session is None:
+        return {
+            "session_id": session_id,
+            "conversation": [],
+            "uploaded_files": [],
+            "last_activity": None,
+            "current_phase": "auto"
+        }
     return {
         "session_id": session_id,
-        "conversation": conversations.get(session_id, []),
-        "uploaded_files": session_files.get(session_id, []),
-        "last_activity": session_timestamps.get(session_id),
-        "current_phase": session_phases.get(session_id, "auto")
+        "conversation": list(session.history),
+        "uploaded_files": session.files,
+        "last_activity": session.last_activity,
+        "current_phase": session.phase or "auto"
     }
 
 @app.delete("/history/{session_id}")
 def clear_history(session_id: str):
-    if session_id in conversations:
-        del conversations[session_id]
-    if session_id in session_files:
-        del session_files[session_id]
-    if session_id in session_timestamps:
-        del session_timestamps[session_id]
-    if session_id in session_phases:
-        del session_phases[session_id]
+    drop_session(session_id)
     return {
         "message": "History cleared", 
         "session_id": session_id
@@ -539,10 +1000,13 @@ def clear_history(session_id: str):
 
 @app.delete("/session/{session_id}/files")
 def clear_session_files(session_id: str):
-    if session_id in session_files:
-        del session_files[session_id]
-    if session_id in session_phases:
-        del session_phases[session_id]
+    with session_lock(session_id):
+        session = get_session(session_id)
+        if session is not None:
+            session.files = []
+            session.phase = None
+            session.files_str = ""
+            session.indexing = {}
     return {
         "message": f"Session file tracking cleared for {session_id}",
         "session_id": session_id
@@ -550,9 +1014,8 @@ def clear_session_files(session_id: str):
 
 @app.post("/session/new")
 def create_new_session():
-    import uuid
     new_session_id = str(uuid.uuid4())
-    session_timestamps[new_session_id] = datetime.now()
+    touch_session(new_session_id)
     return {
         "session_id": new_session_id,
         "message": "New session created"
@@ -561,34 +1024,36 @@ def create_new_session():
 @app.get("/cleanup")
 def cleanup_old_sessions(hours: int = 24):
     cutoff = datetime.now() - timedelta(hours=hours)
-    expired = [sid for sid, ts in session_timestamps.items() if ts < cutoff]
-    
-    for sid in expired:
-        if sid in conversations:
-            del conversations[sid]
-        if sid in session_files:
-            del session_files[sid]
-        if sid in session_timestamps:
-            del session_timestamps[sid]
-        if sid in session_phases:
-            del session_phases[sid]
+    expired = 0
+    remaining = 0
+    # Oldest sessions sit at the head of each shard, so stop at the first one still active
+    for shard, lock in _SHARDS:
+        with lock:
+            while shard and next(iter(shard.values())).last_activity < cutoff:
+                shard.popitem(last=False)
+                expired += 1
+            remaining += len(shard)
     
     return {
-        "cleaned_sessions": len(expired),
+        "cleaned_sessions": expired,
         "cutoff_hours": hours,
-        "remaining_sessions": len(session_timestamps)
+        "remaining_sessions": remaining
     }
 
 @app.get("/sessions")
 def list_sessions():
     sessions_info = []
-    for sid in session_timestamps:
+    snapshot = []
+    for shard, lock in _SHARDS:
+        with lock:
+            snapshot.extend(shard.items())
+    for sid, session in snapshot:
         sessions_info.append({
             "session_id": sid,
-            "last_activity": session_timestamps.get(sid),
-            "message_count": len(conversations.get(sid, [])),
-            "uploaded_files": session_files.get(sid, []),
-            "current_phase": session_phases.get(sid, "auto")
+            "last_activity": session.last_activity,
+            "message_count": len(session.history),
+            "uploaded_files": session.files,
+            "current_phase": session.phase or "auto"
         })
     return {
         "sessions": sessions_info,
@@ -599,15 +1064,16 @@ def list_sessions():
 def list_files():
     try:
         files = []
-        for file in os.listdir(UPLOAD_DIR):
-            if not os.path.isdir(os.path.join(UPLOAD_DIR, file)):
-                file_path = os.path.join(UPLOAD_DIR, file)
-                file_stat = os.stat(file_path)
+        with os.scandir(UPLOAD_DIR) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    continue
+                file_stat = entry.stat()
                 files.append({
-                    "name": file,
+                    "name": entry.name,
                     "size": file_stat.st_size,
                     "modified": file_stat.st_mtime,
-                    "extension": os.path.splitext(file)[1]
+                    "extension": os.path.splitext(entry.name)[1]
                 })
         return {
             "success": True,
@@ -636,7 +1102,10 @@ def home():
         "sdlc_phases": list(SDLC_PHASES.keys()),
         "endpoints": {
             "POST /ask": "Ask questions with SDLC analysis",
+            "POST /ask/stream": "Stream SDLC analysis as server-sent events",
             "POST /upload": "Upload files",
+            "GET /upload/status/{session_id}": "Background indexing status of uploads",
+            "POST /flush": "Persist pending uploads to the vector store",
             "POST /set_phase/{session_id}": "Set SDLC phase",
             "GET /phases": "List SDLC phases",
             "POST /session/new": "Create session",
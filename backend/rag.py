@@ -1,88 +1,448 @@
+import io
 import json
+import mmap
 import os
+import orjson
 import pickle
+import pickletools
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import islice
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.document_loaders import TextLoader, PDFPlumberLoader
+from langchain_community.document_loaders import TextLoader
 from langchain.docstore.document import Document
 
+try:
+    import faiss
+    import numpy as np
+except ImportError:
+    # Retrieval falls back to Chroma's own search
+    faiss = None
+
+try:
+    import fitz
+except ImportError:
+    # PDFs fall back to pdfplumber's slower layout-aware extraction
+    fitz = None
+
+try:
+    import ijson
+except ImportError:
+    # Notebooks are parsed whole with json.load
+    ijson = None
+
+def read_text(file_path):
+    """Decode a UTF-8 file straight from a read-only mapping, skipping the intermediate bytes copy"""
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            text = str(mm, 'utf-8')
+    # Match text-mode reads, which translate \r\n and \r to \n
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+# Cheaper HNSW construction than Chroma's default and a wider search for recall;
+# Chroma fixes these when the collection is first created
+HNSW_METADATA = {"hnsw:M": 16, "hnsw:construction_ef": 64, "hnsw:search_ef": 32}
+
+NOTEBOOK_CELL_HEADERS = {'code': "CODE CELL:\n", 'markdown': "MARKDOWN:\n"}
+
+# Only trusted corpora should enable this: unpickling runs arbitrary code
+UNPICKLE = os.getenv("RAG_UNPICKLE") == "1"
+
+_PICKLE_CONTAINERS = {
+    'EMPTY_DICT': 'dict', 'DICT': 'dict',
+    'EMPTY_LIST': 'list', 'LIST': 'list',
+    'EMPTY_TUPLE': 'tuple', 'TUPLE': 'tuple', 'TUPLE1': 'tuple', 'TUPLE2': 'tuple', 'TUPLE3': 'tuple',
+    'EMPTY_SET': 'set', 'FROZENSET': 'frozenset',
+}
+_PICKLE_MEMO_PUTS = frozenset({'PUT', 'BINPUT', 'LONG_BINPUT', 'MEMOIZE'})
+_PICKLE_MEMO_GETS = frozenset({'GET', 'BINGET', 'LONG_BINGET'})
+
+def pickle_summary(f, max_ops=2048):
+    """Describe a pickle from its opcode stream without executing it"""
+    top_type = None
+    classes = []
+    strings = []
+    counts = {'dict': 0, 'list': 0, 'mark': 0}
+    memo = {}
+    last_was_string = False
+    ops = 0
+    stopped = None
+    # Writers such as joblib interleave raw array bytes the opcode parser can't read;
+    # keep whatever was collected up to that point
+    try:
+        for op, arg, _ in islice(pickletools.genops(f), max_ops):
+            ops += 1
+            name = op.name
+            if name in ('GLOBAL', 'INST'):
+                last_was_string = False
+                cls = arg.replace(' ', '.')
+            elif name == 'STACK_GLOBAL':
+                # Module and qualname are the two strings pushed just before it
+                last_was_string = False
+                cls = '.'.join(strings[-2:])
+            else:
+                cls = None
+                if name in _PICKLE_MEMO_PUTS:
+                    # Memoized strings come back through GETs, e.g. a repeated module name
+                    memo[len(memo) if name == 'MEMOIZE' else arg] = strings[-1] if last_was_string else None
+                    continue
+                if name in _PICKLE_MEMO_GETS:
+                    arg = memo.get(arg)
+                last_was_string = isinstance(arg, str)
+                if last_was_string:
+                    strings.append(arg)
+                kind = _PICKLE_CONTAINERS.get(name)
+                if kind:
+                    top_type = top_type or kind
+                    if kind in counts:
+                        counts[kind] += 1
+                elif name == 'MARK':
+                    counts['mark'] += 1
+            if cls:
+                top_type = top_type or cls
+                if cls not in classes:
+                    classes.append(cls)
+    except ValueError as e:
+        stopped = str(e)
+    return top_type, classes, counts, ops, stopped
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+@lru_cache(maxsize=None)
+def get_embedder(model_name, batch_size=None):
+    """Load an embedding model once per process and share it across pipelines"""
+    # Chunks are encoded in batches per forward pass, larger on GPU where one
+    # wide GEMM is cheaper than several narrow ones
+    import torch
+    cuda = torch.cuda.is_available()
+    if batch_size is None:
+        batch_size = 256 if cuda else 64
+    embedding = HuggingFaceEmbeddings(
+        model_name=model_name,
+        encode_kwargs={"batch_size": batch_size}
+    )
+    if cuda:
+        # FP16 encoder halves weight and activation traffic; MiniLM's ranking is unaffected
+        embedding.client.half()
+    return embedding
+
 class RAGPipeline:
-    def __init__(self):
-        # Correct embedder
-        self.embedding = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2"
-        )
+    def __init__(self, query_cache_size=2048, result_cache_size=1024, embed_batch_size=None,
+                 embedding_cache_size=4096):
+        # Extension -> loader, shared by load_docs and the upload endpoint; loaders are
+        # static so the table pickles into load_docs' worker processes
+        self.loaders = {
+            '.txt': self.load_text_file,
+            '.pdf': self.load_pdf_file,
+            '.py': self.load_python_file,
+            '.ipynb': self.load_ipynb_file,
+            '.json': self.load_json_file,
+            '.csv': self.load_csv_file,
+            '.md': self.load_markdown_file,
+            '.yaml': self.load_yaml_file,
+            '.yml': self.load_yaml_file,
+            '.pt': self.load_pytorch_model_info,
+            '.pth': self.load_pytorch_model_info,
+            '.pkl': self.load_pickle_file,
+            '.pickle': self.load_pickle_file,
+            '.js': partial(self.load_code_file, language='javascript'),
+            '.jsx': partial(self.load_code_file, language='javascript'),
+            '.ts': partial(self.load_code_file, language='typescript'),
+            '.tsx': partial(self.load_code_file, language='typescript'),
+            '.java': partial(self.load_code_file, language='java'),
+            '.cpp': partial(self.load_code_file, language='cpp'),
+            '.c': partial(self.load_code_file, language='c'),
+            '.h': partial(self.load_code_file, language='c'),
+            '.rs': partial(self.load_code_file, language='rust'),
+            '.go': partial(self.load_code_file, language='go'),
+            '.rb': partial(self.load_code_file, language='ruby'),
+            '.php': partial(self.load_code_file, language='php'),
+            '.html': partial(self.load_code_file, language='html'),
+            '.css': partial(self.load_code_file, language='css'),
+            '.xml': partial(self.load_code_file, language='xml'),
+            '.sh': partial(self.load_code_file, language='shell'),
+            '.r': partial(self.load_code_file, language='r'),
+            '.sql': partial(self.load_code_file, language='sql'),
+        }
+
+        self.embedding = get_embedder(EMBEDDING_MODEL, embed_batch_size)
 
         # Correct Chroma initialization
         self.db = Chroma(
             collection_name="rag",
             embedding_function=self.embedding,
-            persist_directory="./chroma_db"
+            persist_directory="./chroma_db",
+            collection_metadata=HNSW_METADATA
         )
 
-    def load_python_file(self, file_path):
+        # Cached vectors are packed float32 arrays (~1.5 KB at 384-d) rather than lists
+        # of Python floats (~12 KB)
+        # sha256(question) -> query embedding, LRU-evicted
+        self.query_cache = OrderedDict()
+        self.query_cache_size = query_cache_size
+        # (question, files, k, index_version) -> formatted results, LRU-evicted
+        self.result_cache = OrderedDict()
+        self.result_cache_size = result_cache_size
+        # sha256(chunk text) -> document embedding, so identical text under another
+        # source (renamed or copied files) is not re-embedded
+        self.embedding_cache = OrderedDict()
+        self.embedding_cache_size = embedding_cache_size
+        # Bumped whenever chunks are added so cached results never outlive the index
+        self.index_version = 0
+        self.cache_lock = threading.Lock()
+
+        # In-process FAISS mirror of the Chroma collection; Chroma stays the source of truth
+        self.faiss_index = None
+        self.faiss_docs = []
+        # source -> FAISS row ids, so filtered searches never scan faiss_docs
+        self.faiss_rows = {}
+        self.faiss_lock = threading.Lock()
+        self.ingest_lock = threading.Lock()
+        self.build_faiss_index()
+
+    def build_faiss_index(self):
+        """Rebuild the FAISS index from the vectors persisted in Chroma"""
+        if faiss is None:
+            return
+
+        data = self.db._collection.get(include=["embeddings", "documents", "metadatas"])
+        with self.faiss_lock:
+            self.faiss_index = None
+            self.faiss_docs = []
+            self.faiss_rows = {}
+            if data["ids"]:
+                docs = [
+                    Document(page_content=text, metadata=metadata or {})
+                    for text, metadata in zip(data["documents"], data["metadatas"])
+                ]
+                self._faiss_add(data["embeddings"], docs)
+        print(f"✓ FAISS index built with {len(self.faiss_docs)} chunks")
+
+    def _faiss_add(self, vectors, docs):
+        # Caller must hold faiss_lock
+        vectors = np.asarray(vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        if self.faiss_index is None:
+            # Exhaustive inner-product search over FP16-stored vectors: half the memory
+            # and scan bandwidth of IndexFlatIP, no training step
+            self.faiss_index = faiss.IndexScalarQuantizer(
+                vectors.shape[1], faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+            )
+        self.faiss_index.add(vectors)
+        for row, doc in enumerate(docs, len(self.faiss_docs)):
+            self.faiss_rows.setdefault(doc.metadata.get("source"), []).append(row)
+        self.faiss_docs.extend(docs)
+
+    def embed_documents(self, texts):
+        """Embed chunk texts, only running the model on texts not seen before"""
+        keys = [hashlib.sha256(text.encode()).digest() for text in texts]
+        cached = [self._cache_get(self.embedding_cache, key) for key in keys]
+        vectors = [vector.tolist() if vector is not None else None for vector in cached]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            fresh = self.embedding.embed_documents([texts[i] for i in missing])
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+                self._cache_put(self.embedding_cache, keys[i], array('f', vector), self.embedding_cache_size)
+        return vectors
+
+    @staticmethod
+    def chunk_id(chunk):
+        """Content-addressed chunk id; includes the source so per-file filtering still works"""
+        source = chunk.metadata.get("source", "")
+        return hashlib.sha256(f"{source}\0{chunk.page_content}".encode()).hexdigest()
+
+    def add_documents(self, chunks):
+        """Embed chunks once and add them to both Chroma and the FAISS index"""
+        # Drop chunks already stored (e.g. a re-uploaded file) before embedding
+        unique = {}
+        for chunk in chunks:
+            unique.setdefault(self.chunk_id(chunk), chunk)
+        if not unique:
+            return
+
+        # Concurrent ingests of the same file must not both pass the existence check and
+        # append the same rows to the FAISS mirror
+        with self.ingest_lock:
+            existing = set(self.db._collection.get(ids=list(unique), include=[])["ids"])
+            ids = [cid for cid in unique if cid not in existing]
+            if not ids:
+                return
+
+            chunks = [unique[cid] for cid in ids]
+            texts = [c.page_content for c in chunks]
+            metadatas = [c.metadata for c in chunks]
+            vectors = self.embed_documents(texts)
+
+            self.db._collection.upsert(
+                ids=ids,
+                embeddings=vectors,
+                documents=texts,
+                metadatas=metadatas
+            )
+
+            if faiss is not None:
+                with self.faiss_lock:
+                    self._faiss_add(vectors, chunks)
+
+        with self.cache_lock:
+            self.index_version += 1
+            self.result_cache.clear()
+
+    def _faiss_search(self, vector, k, full_paths=None):
+        query = np.asarray([vector], dtype=np.float32)
+        faiss.normalize_L2(query)
+
+        with self.faiss_lock:
+            params = None
+            if full_paths:
+                allowed = [
+                    row for source in set(full_paths) for row in self.faiss_rows.get(source, ())
+                ]
+                if not allowed:
+                    return []
+                params = faiss.SearchParameters(
+                    sel=faiss.IDSelectorBatch(np.asarray(allowed, dtype=np.int64))
+                )
+            _, indices = self.faiss_index.search(query, k, params=params)
+            return [self.faiss_docs[i] for i in indices[0] if i >= 0]
+
+    def _cache_get(self, cache, key):
+        with self.cache_lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key]
+        return None
+
+    def _cache_put(self, cache, key, value, max_size):
+        with self.cache_lock:
+            cache[key] = value
+            if len(cache) > max_size:
+                cache.popitem(last=False)
+
+    def embed_query(self, question):
+        """Embed a query string, reusing the vector for repeated questions"""
+        key = hashlib.sha256(question.encode()).digest()
+        vector = self._cache_get(self.query_cache, key)
+        if vector is not None:
+            return vector.tolist()
+        vector = self.embedding.embed_query(question)
+        self._cache_put(self.query_cache, key, array('f', vector), self.query_cache_size)
+        return vector
+
+    @staticmethod
+    def load_text_file(file_path):
+        """Load plain text files (.txt)"""
+        return TextLoader(file_path).load()
+
+    @staticmethod
+    def load_python_file(file_path):
         """Load Python files (.py)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_text(file_path)
         return [Document(page_content=content, metadata={"source": file_path, "type": "python"})]
 
-    def load_ipynb_file(self, file_path):
+    @staticmethod
+    def load_ipynb_file(file_path):
         """Load Jupyter Notebook files (.ipynb)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            notebook = json.load(f)
+        # Extract all cells content straight into one buffer
+        buf = io.StringIO()
+        with open(file_path, 'rb') as f:
+            # Stream cells one at a time rather than materializing outputs and base64 blobs
+            cells = ijson.items(f, 'cells.item') if ijson is not None else json.load(f).get('cells', [])
+            for cell in cells:
+                header = NOTEBOOK_CELL_HEADERS.get(cell.get('cell_type', ''))
+                if header is None:
+                    continue
+                if buf.tell():
+                    buf.write('\n')
+                buf.write(header)
+                source = cell.get('source', [])
+                # nbformat allows a cell's source as one string or a list of lines
+                if isinstance(source, str):
+                    buf.write(source)
+                else:
+                    buf.writelines(source)
+                buf.write('\n')
         
-        # Extract all cells content
-        content_parts = []
-        for cell in notebook.get('cells', []):
-            cell_type = cell.get('cell_type', '')
-            source = ''.join(cell.get('source', []))
-            
-            if cell_type == 'code':
-                content_parts.append(f"CODE CELL:\n{source}\n")
-            elif cell_type == 'markdown':
-                content_parts.append(f"MARKDOWN:\n{source}\n")
-        
-        content = '\n'.join(content_parts)
+        content = buf.getvalue()
         return [Document(page_content=content, metadata={"source": file_path, "type": "jupyter"})]
 
-    def load_json_file(self, file_path):
+    @staticmethod
+    def load_json_file(file_path):
         """Load JSON files (.json)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        content = json.dumps(data, indent=2)
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        try:
+            content = orjson.dumps(orjson.loads(raw), option=orjson.OPT_INDENT_2).decode()
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals are only accepted by the stdlib parser
+            content = json.dumps(json.loads(raw), indent=2)
         return [Document(page_content=content, metadata={"source": file_path, "type": "json"})]
 
-    def load_csv_file(self, file_path):
+    @staticmethod
+    def load_csv_file(file_path):
         """Load CSV files (.csv)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_text(file_path)
         return [Document(page_content=content, metadata={"source": file_path, "type": "csv"})]
 
-    def load_markdown_file(self, file_path):
+    @staticmethod
+    def load_pdf_file(file_path):
+        """Load PDF files (.pdf), one document per page"""
+        if fitz is None:
+            from langchain_community.document_loaders import PDFPlumberLoader
+            return PDFPlumberLoader(file_path).load()
+        with fitz.open(file_path) as pdf:
+            return [
+                Document(page_content=page.get_text(), metadata={"source": file_path, "page": i})
+                for i, page in enumerate(pdf)
+            ]
+
+    @staticmethod
+    def load_markdown_file(file_path):
         """Load Markdown files (.md)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_text(file_path)
         return [Document(page_content=content, metadata={"source": file_path, "type": "markdown"})]
 
-    def load_yaml_file(self, file_path):
+    @staticmethod
+    def load_yaml_file(file_path):
         """Load YAML files (.yaml, .yml)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_text(file_path)
         return [Document(page_content=content, metadata={"source": file_path, "type": "yaml"})]
 
-    def load_code_file(self, file_path, language):
+    @staticmethod
+    def load_code_file(file_path, language):
         """Load generic code files (js, java, cpp, etc.)"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_text(file_path)
         return [Document(page_content=content, metadata={"source": file_path, "type": language})]
 
-    def load_pytorch_model_info(self, file_path):
+    @staticmethod
+    def load_pytorch_model_info(file_path):
         """Load PyTorch model files (.pt, .pth) - extracts metadata only"""
         try:
             import torch
-            # Load model metadata without loading full weights
-            checkpoint = torch.load(file_path, map_location='cpu')
+            # Load model metadata without loading full weights: tensors stay memory-mapped
+            # and are never touched, and weights_only refuses to run pickled code
+            try:
+                try:
+                    checkpoint = torch.load(file_path, map_location='cpu', mmap=True, weights_only=True)
+                except (TypeError, RuntimeError):
+                    # torch < 2.1 or legacy non-zip checkpoints, which cannot be mapped
+                    checkpoint = torch.load(file_path, map_location='cpu', weights_only=True)
+            except pickle.UnpicklingError:
+                # Custom pickled objects need a full unpickle, only allowed for trusted corpora
+                if not UNPICKLE:
+                    raise
+                checkpoint = torch.load(file_path, map_location='cpu', weights_only=False)
             
             info_parts = [f"PyTorch Model: {os.path.basename(file_path)}"]
             
@@ -108,13 +468,26 @@ class RAGPipeline:
             content = f"PyTorch Model File: {os.path.basename(file_path)}\nNote: Model metadata could not be extracted. Error: {str(e)}"
             return [Document(page_content=content, metadata={"source": file_path, "type": "pytorch_model"})]
 
-    def load_pickle_file(self, file_path):
+    @staticmethod
+    def load_pickle_file(file_path, unpickle=UNPICKLE):
         """Load pickle files (.pkl, .pickle) - extracts basic info"""
         try:
+            content = f"Pickle File: {os.path.basename(file_path)}\n"
             with open(file_path, 'rb') as f:
-                data = pickle.load(f)
+                if unpickle:
+                    data = pickle.load(f)
+                else:
+                    top_type, classes, counts, ops, stopped = pickle_summary(f)
+            
+            if not unpickle:
+                content += f"Type: {top_type or 'unknown'}\n"
+                if classes:
+                    content += f"Classes: {classes[:20]}\n"
+                content += f"Structure: {counts['dict']} dicts, {counts['list']} lists, {counts['mark']} marks in {ops} opcodes\n"
+                if stopped:
+                    content += f"Note: opcode scan stopped early ({stopped})\n"
+                return [Document(page_content=content, metadata={"source": file_path, "type": "pickle"})]
             
-            content = f"Pickle File: {os.path.basename(file_path)}\n"
             content += f"Type: {type(data).__name__}\n"
             
             if isinstance(data, (list, tuple)):
@@ -130,84 +503,63 @@ class RAGPipeline:
             content = f"Pickle File: {os.path.basename(file_path)}\nNote: Could not load pickle file. Error: {str(e)}"
             return [Document(page_content=content, metadata={"source": file_path, "type": "pickle"})]
 
-    def load_docs(self, path="./data/docs/"):
-        docs = []
+    def load_docs(self, path="./data/docs/", ingest_batch_size=512, persist=True):
+        splitter = RecursiveCharacterTextSplitter(
+            chunk_size=500,
+            chunk_overlap=80
+        )
+        docs_loaded = 0
+        chunk_count = 0
+        # Chunks waiting to be embedded and added to Chroma + FAISS
+        batch = []
         
-        # Supported file extensions mapping
-        loaders = {
-            '.txt': lambda f: TextLoader(f).load(),
-            '.pdf': lambda f: PDFPlumberLoader(f).load(),
-            '.py': self.load_python_file,
-            '.ipynb': self.load_ipynb_file,
-            '.json': self.load_json_file,
-            '.csv': self.load_csv_file,
-            '.md': self.load_markdown_file,
-            '.yaml': self.load_yaml_file,
-            '.yml': self.load_yaml_file,
-            '.pt': self.load_pytorch_model_info,
-            '.pth': self.load_pytorch_model_info,
-            '.pkl': self.load_pickle_file,
-            '.pickle': self.load_pickle_file,
-            '.js': lambda f: self.load_code_file(f, 'javascript'),
-            '.jsx': lambda f: self.load_code_file(f, 'javascript'),
-            '.ts': lambda f: self.load_code_file(f, 'typescript'),
-            '.tsx': lambda f: self.load_code_file(f, 'typescript'),
-            '.java': lambda f: self.load_code_file(f, 'java'),
-            '.cpp': lambda f: self.load_code_file(f, 'cpp'),
-            '.c': lambda f: self.load_code_file(f, 'c'),
-            '.h': lambda f: self.load_code_file(f, 'c'),
-            '.rs': lambda f: self.load_code_file(f, 'rust'),
-            '.go': lambda f: self.load_code_file(f, 'go'),
-            '.rb': lambda f: self.load_code_file(f, 'ruby'),
-            '.php': lambda f: self.load_code_file(f, 'php'),
-            '.html': lambda f: self.load_code_file(f, 'html'),
-            '.css': lambda f: self.load_code_file(f, 'css'),
-            '.xml': lambda f: self.load_code_file(f, 'xml'),
-            '.sh': lambda f: self.load_code_file(f, 'shell'),
-            '.r': lambda f: self.load_code_file(f, 'r'),
-            '.sql': lambda f: self.load_code_file(f, 'sql'),
-        }
-
-        # Load all documents
-        for file in os.listdir(path):
-            full_path = os.path.join(path, file)
-            
-            # Skip directories
-            if os.path.isdir(full_path):
-                continue
-            
-            # Get file extension
-            _, ext = os.path.splitext(file)
-            ext = ext.lower()
+        # Parsing is CPU-bound pure Python (pdfplumber, json, pickle), so files load in parallel processes
+        with ProcessPoolExecutor(max_workers=max(1, (os.cpu_count() or 2) - 1)) as pool:
+            pending = []
+            for file in os.listdir(path):
+                full_path = os.path.join(path, file)
+                
+                # Skip directories
+                if os.path.isdir(full_path):
+                    continue
+                
+                # Get file extension
+                _, ext = os.path.splitext(file)
+                ext = ext.lower()
+                
+                # Load file if extension is supported
+                if ext in self.loaders:
+                    print(f"Loading {file}...")
+                    pending.append((file, pool.submit(self.loaders[ext], full_path)))
+                else:
+                    print(f"⊘ Skipping {file} (unsupported format: {ext})")
             
-            # Load file if extension is supported
-            if ext in loaders:
+            # Split and embed each file as it arrives while the workers parse the rest
+            for file, future in pending:
                 try:
-                    print(f"Loading {file}...")
-                    loaded_docs = loaders[ext](full_path)
-                    docs.extend(loaded_docs)
+                    loaded_docs = future.result()
                     print(f"✓ Successfully loaded {file}")
                 except Exception as e:
                     print(f"✗ Error loading {file}: {str(e)}")
-            else:
-                print(f"⊘ Skipping {file} (unsupported format: {ext})")
+                    continue
+                docs_loaded += len(loaded_docs)
+                batch.extend(splitter.split_documents(loaded_docs))
+                if len(batch) >= ingest_batch_size:
+                    chunk_count += len(batch)
+                    self.add_documents(batch)
+                    batch = []
 
-        print(f"\nTotal documents loaded: {len(docs)}")
+        chunk_count += len(batch)
+        self.add_documents(batch)
+        print(f"\nTotal documents loaded: {docs_loaded}")
+        print(f"Split into {chunk_count} chunks")
 
-        # Split into chunks
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,
-            chunk_overlap=80
-        )
-        chunks = splitter.split_documents(docs)
-        print(f"Split into {len(chunks)} chunks")
-
-        # Add to Chroma (embedding done automatically)
-        self.db.add_documents(chunks)
-        self.db.persist()
-        print("✓ Documents embedded and persisted to Chroma DB")
+        # Repeated incremental loads pass persist=False and persist once at the end
+        if persist:
+            self.db.persist()
+            print("✓ Documents embedded and persisted to Chroma DB")
 
-    def query(self, question, k=5, source_files=None):
+    def query(self, question, k=5, source_files=None, vector=None):
         """
         Query the vector database with optional file filtering
         
@@ -215,23 +567,36 @@ class RAGPipeline:
             question: The query string
             k: Number of results to return (default: 5)
             source_files: Optional list of filenames to filter by (e.g., ['file1.py', 'file2.txt'])
+            vector: Optional precomputed query embedding; skips embedding when given
         
         Returns:
             Formatted string with search results
         """
+        cache_key = None
+        if vector is None:
+            cache_key = (question, tuple(sorted(source_files or ())), k, self.index_version)
+            cached = self._cache_get(self.result_cache, cache_key)
+            if cached is not None:
+                return cached
+            vector = self.embed_query(question)
+
+        full_paths = None
         if source_files:
             # Build full paths for filtering
             full_paths = [os.path.join("./data/docs/", f) for f in source_files]
-            
+
+        if self.faiss_index is not None:
+            results = self._faiss_search(vector, k, full_paths)
+        elif full_paths:
             # Query with metadata filter
-            results = self.db.similarity_search(
-                question, 
+            results = self.db.similarity_search_by_vector(
+                vector, 
                 k=k,
                 filter={"source": {"$in": full_paths}}
             )
         else:
             # Query all documents (no filtering)
-            results = self.db.similarity_search(question, k=k)
+            results = self.db.similarity_search_by_vector(vector, k=k)
         
         # Format results with metadata
         formatted_results = []
@@ -244,4 +609,7 @@ class RAGPipeline:
                 f"{doc.page_content}\n"
             )
         
-        return "\n".join(formatted_results)
\ No newline at end of file
+        output = "\n".join(formatted_results)
+        if cache_key is not None:
+            self._cache_put(self.result_cache, cache_key, output, self.result_cache_size)
+        return output
\ No newline at end of file